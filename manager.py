@@ -4,9 +4,17 @@ from pynput.keyboard import Controller
 from typing import Optional, Callable, List, Dict, Awaitable, OrderedDict
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from transitions import Machine
 from enum import Enum
+import functools
 import asyncio
+import queue
+import signal
+import sys
+import threading
+
+# Отладочный вывод; при DEBUG = False log ничего не делает
+DEBUG = False
+log = print if DEBUG else (lambda *args, **kwargs: None)
 
 class KeyType(Enum):
     CTRL = 'CTRL'
@@ -19,20 +27,36 @@ class KeyState(Enum):
     RELEASED = 2
 
 class HotkeyState:
+    __slots__ = ('state', 'name', 'key', 'type')
+
     def __init__(self, state: KeyState, key_name: str):
         if not key_name:
             raise ValueError("Имя клавиши не может быть пустым.")
         
-        self.state = state
-        self.name = key_name
-        self.key = self.get_key_by_name(key_name)
-        self.type = self.get_key_type(self.key)
+        key = self.get_key_by_name(key_name)
+        object.__setattr__(self, 'state', state)
+        object.__setattr__(self, 'name', key_name)
+        object.__setattr__(self, 'key', key)
+        object.__setattr__(self, 'type', self.get_key_type(key))
+
+    def __setattr__(self, name, value):
+        # Экземпляры разделяются через кэш _hotkey_for, поэтому менять их нельзя
+        raise AttributeError(f"HotkeyState неизменяем, атрибут '{name}' нельзя изменить.")
+
+    def __eq__(self, other):
+        if not isinstance(other, HotkeyState):
+            return NotImplemented
+        return self.state is other.state and self.name == other.name
+
+    def __hash__(self):
+        return hash((self.state, self.name))
 
     @staticmethod
     def get_key_name(key: keyboard.Key) -> str:
         """Возвращает имя клавиши."""
-        if hasattr(key, 'char'):
-            return key.char
+        char = getattr(key, 'char', None)
+        if char is not None:
+            return char
         return str(key).split('.')[-1]
 
     @staticmethod
@@ -49,15 +73,21 @@ class HotkeyState:
     @staticmethod
     def get_key_type(key: keyboard.Key) -> KeyType:
         """Возвращает тип клавиши."""
-        if key in keyboard.Key.__members__.values():
+        if isinstance(key, keyboard.Key):
             return KeyType.CTRL
-        if hasattr(key, 'char'):
-            if key.char.isdigit():
+        char = getattr(key, 'char', None)
+        if char:
+            if char.isdigit():
                 return KeyType.DIGIT
-            if key.char.isalpha():
+            if char.isalpha():
                 return KeyType.ALPHA
         return KeyType.OTHER
 
+@functools.lru_cache(maxsize=256)
+def _hotkey_for(key: keyboard.Key, state: KeyState) -> HotkeyState:
+    """Возвращает закэшированный HotkeyState для клавиши и её состояния."""
+    return HotkeyState(state, HotkeyState.get_key_name(key))
+
 class ClipboardManager:
     def __init__(self):
         """Инициализирует менеджер буфера обмена."""
@@ -137,11 +167,12 @@ class Clipboard:
             return
         
         for index, content in self.buffer.items():
-            print(f"Ячейка {index}: {content if isinstance(content, str) else repr(content)}")
+            print(f"Ячейка {index}: {content}")
 
 class BaseCommand(ABC):
+    @staticmethod
     @abstractmethod
-    def execute(self, *args, **kwargs):
+    def execute(*args, **kwargs):
         """Метод, который нужно переопределить в подклассе для реализации команды."""
         if args or kwargs:
             print(f"Приняты аргументы: args={args}, kwargs={kwargs}, но метод находится в разработке.")
@@ -149,7 +180,8 @@ class BaseCommand(ABC):
             print("Эта функция находится в разработке.")
 
 class CopyCommand(BaseCommand):
-    def execute(self, *args, **kwargs):
+    @staticmethod
+    def execute(*args, **kwargs):
         if args:
             clipboard.copy(args[0])
         else:
@@ -157,7 +189,8 @@ class CopyCommand(BaseCommand):
             hotkey_manager.set_hotkey_state(1, KeyState.PRESSED)
 
 class PasteCommand(BaseCommand):
-    def execute(self, *args, **kwargs):
+    @staticmethod
+    def execute(*args, **kwargs):
         if args:
             clipboard.paste(args[0])
         else:
@@ -165,22 +198,26 @@ class PasteCommand(BaseCommand):
             hotkey_manager.set_hotkey_state(1, KeyState.PRESSED)
 
 class ClearCommand(BaseCommand):
-    def execute(self, *args, **kwargs):
+    @staticmethod
+    def execute(*args, **kwargs):
         clipboard.clear()
 
 class ListCommand(BaseCommand):
-    def execute(self, *args, **kwargs):
+    @staticmethod
+    def execute(*args, **kwargs):
         clipboard.list()
 
 class SettingsCommand(BaseCommand):
-    def execute(self, *args, **kwargs):
+    @staticmethod
+    def execute(*args, **kwargs):
         if args or kwargs:
             print(f"Приняты аргументы: args={args}, kwargs={kwargs}, но метод находится в разработке.")
         else:
             print("Настройки открыты!")
 
 class HelpCommand(BaseCommand):
-    def execute(self, *args, **kwargs):
+    @staticmethod
+    def execute(*args, **kwargs):
         if args or kwargs:
             print(f"Приняты аргументы: args={args}, kwargs={kwargs}, но метод находится в разработке.")
         else:
@@ -188,11 +225,26 @@ class HelpCommand(BaseCommand):
 
 @dataclass
 class MenuCommand:
+    __slots__ = ('key', 'name', 'description', 'action')
+
     key: str
     name: str
     description: str
     action: Callable
 
+COMMANDS: List[MenuCommand] = [
+    MenuCommand(key='s', name="settings", description="Открыть настройки", action=SettingsCommand.execute),
+    MenuCommand(key='c', name="copy", description="Скопировать текст", action=CopyCommand.execute),
+    MenuCommand(key='p', name="paste", description="Вставить текст", action=PasteCommand.execute),
+    MenuCommand(key='h', name="help", description="Открыть помощь", action=HelpCommand.execute),
+    MenuCommand(key='l', name="list", description="Отобразить список элементов", action=ListCommand.execute),
+    MenuCommand(key='r', name="clear", description="Очистить экран", action=ClearCommand.execute)
+]
+
+# Таблицы поиска действий, построенные один раз при импорте
+KEY_TO_ACTION: Dict[str, Callable] = {command.key: command.action for command in COMMANDS}
+NAME_TO_ACTION: Dict[str, Callable] = {command.name: command.action for command in COMMANDS}
+
 class HotkeyManager:
     def __init__(self):
         """Инициализирует HotkeyManager с состоянием горячих клавиш."""
@@ -208,7 +260,7 @@ class HotkeyManager:
             state (KeyState): Состояние горячей клавиши.
         """
         if hotkey in self.hotkeys_state:
-            self.hotkeys_state[hotkey].state = state
+            self.hotkeys_state[hotkey] = HotkeyState(state, self.hotkeys_state[hotkey].name)
 
     def get_hotkey_state(self, hotkey: int) -> KeyState:
         """Возвращает состояние горячей клавиши.
@@ -237,39 +289,67 @@ class HotkeyManager:
                 return hotkey
         return None
 
-class MenuState:
-    def __init__(self):
-        """Инициализирует MenuState с пустым списком команд."""
-        self.machine = Machine(model=self, states=['wait'], initial='wait')
-
-    def add_command(self, command: MenuCommand):
-        """Добавляет новую команду и соответствующий переход в состояние."""
-        self.machine.add_state(command.name)
-        self.machine.add_transition(trigger=f'go_to_{command.name}', source='wait', dest=command.name, after=command.action)
-        self.machine.add_transition(trigger='back_to_wait', source=command.name, dest='wait')
-
 class KeyInterceptor:
-    def __init__(self, callback: Optional[Callable[[OrderedDict], Awaitable[None]]] = None):
-        """Инициализирует KeyInterceptor и запускает прослушивание клавиатуры."""
-        self.pressed_keys = set()
-        self.combination = OrderedDict()
+    def __init__(self, callback: Optional[Callable[[Dict], Awaitable[None]]] = None, finalize_delay: float = 0.02):
+        """Инициализирует KeyInterceptor и запускает прослушивание клавиатуры.
+        
+        Args:
+            callback (Optional[Callable[[Dict], Awaitable[None]]]): Функция, вызываемая при завершении комбинации.
+            finalize_delay (float): Пауза в секундах после отпускания всех клавиш, после которой комбинация считается завершённой.
+        """
+        self.combination: Dict[keyboard.Key, HotkeyState] = {}
+        self._pressed_count = 0
+        self._lock = threading.Lock()
+        self._finished: List[Dict[keyboard.Key, HotkeyState]] = []
+        self._finalize_timer: Optional[asyncio.TimerHandle] = None
         self.callback = callback
+        self.finalize_delay = finalize_delay
+        self._log: Callable[[str], None] = log
+        if DEBUG:
+            self._log_q: queue.SimpleQueue = queue.SimpleQueue()
+            self._log = self._log_q.put
+            self._log_thread = threading.Thread(target=self._drain_log, daemon=True)
+            self._log_thread.start()
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._loop_thread.start()
         self.listener = keyboard.Listener(
             on_press=self.intercept_on_press,
             on_release=self.intercept_on_release)
         self.listener.start()
 
+    def stop(self):
+        """Останавливает прослушивание клавиатуры и фоновый цикл событий."""
+        self.listener.stop()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def _drain_log(self):
+        """Выводит накопленные сообщения пачками: одна запись в stdout на пачку."""
+        while True:
+            batch = [self._log_q.get()]
+            while True:
+                try:
+                    batch.append(self._log_q.get_nowait())
+                except queue.Empty:
+                    break
+            sys.stdout.write("".join(batch))
+            sys.stdout.flush()
+
     def intercept_on_press(self, key):
         """Перехватывает нажатие клавиши.
         
         Args:
             key: Нажатая клавиша.
         """
-        if key not in self.pressed_keys:
-            print(f'Key {key} pressed')
-            key_name = HotkeyState.get_key_name(key)
-            self.pressed_keys.add(key)
-            self.combination[key] = HotkeyState(KeyState.PRESSED, key_name)
+        with self._lock:
+            hotkey = self.combination.get(key)
+            if hotkey is None or hotkey.state is not KeyState.PRESSED:
+                # Сначала строим состояние: _hotkey_for может бросить ValueError,
+                # и тогда счётчик зажатых клавиш не должен измениться
+                pressed = _hotkey_for(key, KeyState.PRESSED)
+                self._log(f'Key {key} pressed\n')
+                self.combination[key] = pressed
+                self._pressed_count += 1
 
     def intercept_on_release(self, key):
         """Перехватывает отпускание клавиши.
@@ -277,84 +357,106 @@ class KeyInterceptor:
         Args:
             key: Отпущенная клавиша.
         """
-        if key in self.pressed_keys:
-            print(f'Key {key} released')
-            key_name = HotkeyState.get_key_name(key)
-            self.pressed_keys.remove(key)
-            self.combination[key] = HotkeyState(KeyState.RELEASED, key_name)
-            if not self.pressed_keys:
-                asyncio.run(self.finalize_combination(self.callback))
-
-    async def finalize_combination(self, callback: Optional[Callable[[OrderedDict], Awaitable[None]]] = None):
-        """Фиксирует и выводит текущую комбинацию клавиш.
+        with self._lock:
+            hotkey = self.combination.get(key)
+            if hotkey is None or hotkey.state is not KeyState.PRESSED:
+                return
+            self._log(f'Key {key} released\n')
+            self._pressed_count -= 1
+            self.combination[key] = _hotkey_for(key, KeyState.RELEASED)
+            all_released = not self._pressed_count
+            if all_released:
+                self._finished.append(self.combination)
+                self.combination = {}
+        if all_released:
+            self._loop.call_soon_threadsafe(self._schedule_finalize)
+
+    def _schedule_finalize(self):
+        """Перезапускает таймер завершения, чтобы пауза отсчитывалась от последнего отпускания.
+        
+        Выполняется в фоновом цикле событий.
+        """
+        if self._finalize_timer is not None:
+            self._finalize_timer.cancel()
+        self._finalize_timer = self._loop.call_later(self.finalize_delay, self._flush_finished)
+
+    def _flush_finished(self):
+        """Передаёт завершённые комбинации в callback, если за время паузы не зажата ни одна клавиша.
+        
+        Выполняется в фоновом цикле событий.
+        """
+        self._finalize_timer = None
+        with self._lock:
+            if self._pressed_count or not self._finished:
+                return
+            combinations = self._finished
+            self._finished = []
+        self._loop.create_task(self._finalize_combinations(combinations))
+
+    async def _finalize_combinations(self, combinations: List[Dict]):
+        """Завершает комбинации по очереди, сохраняя порядок, в котором они были набраны."""
+        for combination in combinations:
+            await self.finalize_combination(combination, self.callback)
+
+    async def finalize_combination(self, combination: Dict, callback: Optional[Callable[[Dict], Awaitable[None]]] = None):
+        """Выводит завершённую комбинацию клавиш и передаёт её в callback.
+        
+        Выполняется в фоновом цикле событий и получает комбинацию,
+        уже отсоединённую от KeyInterceptor.
         
         Args:
-            callback (Optional[Callable[[OrderedDict], Awaitable[None]]]): Функция, вызываемая при завершении комбинации.
+            combination (Dict): Завершённая комбинация клавиш.
+            callback (Optional[Callable[[Dict], Awaitable[None]]]): Функция, вызываемая при завершении комбинации.
         """
-        combination = self.get_key_combination()
-        print(f'Key combination: {combination}')
-        self.combination.clear()
+        self._log(f'Key combination: {combination}\n')
         if callback:
             await callback(combination)
 
-    def get_key_combination(self) -> OrderedDict:
-        """Возвращает OrderedDict с последовательностью зажатых и отпущенных клавиш.
+    def get_key_combination(self) -> Dict:
+        """Возвращает словарь с последовательностью зажатых и отпущенных клавиш.
         
         Returns:
-            OrderedDict: OrderedDict с последовательностью зажатых и отпущенных клавиш.
+            Dict: Словарь с последовательностью зажатых и отпущенных клавиш в порядке нажатия.
         """
         return self.combination
 
 class HotkeyComparator:
     @staticmethod
-    def compare(combination1: OrderedDict, combination2: OrderedDict) -> bool:
-        """Сравнивает два OrderedDict из HotkeyState.
+    def compare(combination1: Dict, combination2: Dict) -> bool:
+        """Сравнивает две комбинации из HotkeyState с учётом порядка клавиш.
         
         Args:
-            combination1 (OrderedDict): Первая комбинация.
-            combination2 (OrderedDict): Вторая комбинация.
+            combination1 (Dict): Первая комбинация.
+            combination2 (Dict): Вторая комбинация.
         
         Returns:
             bool: True, если комбинации равны, иначе False.
         """
-        return combination1 == combination2
+        return combination1 == combination2 and list(combination1) == list(combination2)
 
     @staticmethod
-    def is_subset(subset: OrderedDict, superset: OrderedDict) -> bool:
-        """Проверяет, является ли один OrderedDict подмножеством другого.
+    def is_subset(subset: Dict, superset: Dict) -> bool:
+        """Проверяет, входят ли элементы одной комбинации в другую в том же порядке.
         
         Args:
-            subset (OrderedDict): Потенциальное подмножество.
-            superset (OrderedDict): Потенциальное надмножество.
+            subset (Dict): Потенциальное подмножество.
+            superset (Dict): Потенциальное надмножество.
         
         Returns:
             bool: True, если subset является подмножеством superset, иначе False.
         """
-        subset_iter = iter(subset.items())
-        for key, value in superset.items():
-            if key == next(subset_iter, (None, None))[0] and value == subset[key]:
-                try:
-                    next(subset_iter)
-                except StopIteration:
-                    return True
-        return False
+        superset_iter = iter(superset.items())
+        for key, value in subset.items():
+            for super_key, super_value in superset_iter:
+                if super_key == key and super_value == value:
+                    break
+            else:
+                return False
+        return True
 
 class CommandManager:
-    def __init__(self, menu: MenuState):
-        self.menu = menu
-        self.commands = [
-            MenuCommand(key='s', name="settings", description="Открыть настройки", action=SettingsCommand().execute),
-            MenuCommand(key='c', name="copy", description="Скопировать текст", action=CopyCommand().execute),
-            MenuCommand(key='p', name="paste", description="Вставить текст", action=PasteCommand().execute),
-            MenuCommand(key='h', name="help", description="Открыть помощь", action=HelpCommand().execute),
-            MenuCommand(key='l', name="list", description="Отобразить список элементов", action=ListCommand().execute),
-            MenuCommand(key='r', name="clear", description="Очистить экран", action=ClearCommand().execute)
-        ]
-        self.add_commands_to_menu()
-
-    def add_commands_to_menu(self):
-        for command in self.commands:
-            self.menu.add_command(command)
+    def __init__(self):
+        self.commands = COMMANDS
 
     def print_commands(self):
         """Выводит название и описание каждой команды."""
@@ -370,8 +472,7 @@ class CommandManager:
         Returns:
             Callable: Функция, связанная с данной командой, или None, если команда не найдена.
         """
-        command_dict: Dict[str, Callable] = {command.name: command.action for command in self.commands}
-        return command_dict.get(name, None)
+        return NAME_TO_ACTION.get(name)
 
     def get_command_by_key(self, key: str) -> Optional[Callable]:
         """Возвращает функцию по символу команды.
@@ -382,41 +483,42 @@ class CommandManager:
         Returns:
             Callable: Функция, связанная с данной командой, или None, если команда не найдена.
         """
-        for command in self.commands:
-            if command.key == key:
-                return getattr(self.menu, f'go_to_{command.name}')
-        return None
+        return KEY_TO_ACTION.get(key)
 
     def execute_command(self, command_name: str):
         """Выполняет команду по её имени."""
         action = self.get_command_action(command_name)
         if action:
-            print(f"Выполнение команды: {command_name}")
+            log(f"Выполнение команды: {command_name}")
             action()
 
 # Создадим экземпляр HotkeyManager
 hotkey_manager = HotkeyManager()
 
-# Создадим экземпляр MenuState
-menu = MenuState()
-
-# Создадим экземпляр CommandManager и добавим команды в меню
-command_manager = CommandManager(menu)
+# Создадим экземпляр CommandManager
+command_manager = CommandManager()
 
 # Создадим экземпляр ClipboardManager и Clipboard
 clipboard_manager = ClipboardManager()
 clipboard = Clipboard(max_size=5, clipboard_manager=clipboard_manager)
 
 # Функция для вывода комбинации
-async def print_combination(combination: OrderedDict):
+async def print_combination(combination: Dict):
     print("Комбинация клавиш:", combination)
 
 # Создание экземпляра KeyInterceptor с привязкой функции вывода комбинации
 key_interceptor = KeyInterceptor(callback=print_combination)
 
-# Основной цикл, чтобы программа не завершалась
+# Основной цикл: ждёт Ctrl+C и останавливает перехват клавиш
 async def main():
-    while True:
-        await asyncio.sleep(1)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGINT, stop.set)
+    except NotImplementedError:
+        # В Windows add_signal_handler не поддерживается
+        signal.signal(signal.SIGINT, lambda signum, frame: loop.call_soon_threadsafe(stop.set))
+    await stop.wait()
+    key_interceptor.stop()
 
 asyncio.run(main())